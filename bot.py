@@ -1,9 +1,11 @@
 # bot.py
 import asyncio
 import logging
+import queue
 import signal
 import sys
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+import aiohttp
 from aiohttp import web
 from aiogram import Bot, Dispatcher
 from aiogram.types import Message
@@ -15,28 +17,38 @@ from config import (
     HEALTHCHECK_PORT, HEALTHCHECK_ENABLED
 )
 from db import (
-    init_db, is_posted, mark_posted, reset_db,
+    init_db, filter_unposted, mark_posted, reset_db,
     increment_today_posts, get_today_posts_count, cleanup_old_stats
 )
 from rss_fetcher import fetch_items
-from publisher import publish_post_with_retry
+from publisher import publish_post_with_retry, load_default_image, close_hf_client
 
 # === ЛОГИРОВАНИЕ ===
+_log_listener: QueueListener | None = None
+
 def setup_logging():
-    handlers = [
+    """Неблокирующее логирование: корутины кладут записи в очередь,
+    файл и stdout пишет фоновый поток QueueListener"""
+    global _log_listener
+
+    log_queue = queue.Queue(-1)
+    _log_listener = QueueListener(
+        log_queue,
         RotatingFileHandler(
             LOG_FILE,
             maxBytes=LOG_MAX_BYTES,
             backupCount=LOG_BACKUP_COUNT,
             encoding='utf-8'
         ),
-        logging.StreamHandler(sys.stdout)
-    ]
-    
+        logging.StreamHandler(sys.stdout),
+    )
+    _log_listener.start()
+
+    # Формат применяется на QueueHandler — listener получает уже готовое сообщение
     logging.basicConfig(
         level=getattr(logging, LOG_LEVEL),
         format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-        handlers=handlers
+        handlers=[QueueHandler(log_queue)]
     )
 
 setup_logging()
@@ -46,6 +58,7 @@ logger = logging.getLogger(__name__)
 bot = Bot(BOT_TOKEN)
 dp = Dispatcher()
 shutdown_event = asyncio.Event()
+http_session: aiohttp.ClientSession | None = None  # общая HTTP-сессия (RSS, og:image)
 last_check_time = None
 last_check_status = "OK"
 posts_today = 0
@@ -77,7 +90,7 @@ async def start_healthcheck_server():
     await runner.setup()
     site = web.TCPSite(runner, '0.0.0.0', HEALTHCHECK_PORT)
     await site.start()
-    logger.info(f"Healthcheck server started on port {HEALTHCHECK_PORT}")
+    logger.info("Healthcheck server started on port %d", HEALTHCHECK_PORT)
 
 # === ОСНОВНАЯ ЛОГИКА ===
 async def post_cycle() -> int:
@@ -91,30 +104,31 @@ async def post_cycle() -> int:
         posts_today = today_count
         
         if today_count >= MAX_POSTS_PER_DAY:
-            logger.info(f"Daily limit reached: {today_count}/{MAX_POSTS_PER_DAY}")
+            logger.info("Daily limit reached: %d/%d", today_count, MAX_POSTS_PER_DAY)
             last_check_status = "LIMIT_REACHED"
             return 0
         
         remaining_today = MAX_POSTS_PER_DAY - today_count
         limit_this_run = min(MAX_POSTS_PER_CHECK, remaining_today)
         
-        logger.info(f"Checking RSS (limit: {limit_this_run}, today: {today_count}/{MAX_POSTS_PER_DAY})")
+        logger.info("Checking RSS (limit: %d, today: %d/%d)", limit_this_run, today_count, MAX_POSTS_PER_DAY)
         
-        items = fetch_items(RSS_FEEDS, limit_total=30)
-        logger.info(f"Found {len(items)} items")
+        items = await fetch_items(http_session, RSS_FEEDS, limit_total=30)
+        logger.info("Found %d items", len(items))
         
         posted_count = 0
-        
+        already_posted = filter_unposted([it["uid"] for it in items])
+
         for it in items:
             if posted_count >= limit_this_run:
                 break
-            
+
             uid = it["uid"]
-            if is_posted(uid):
+            if uid in already_posted:
                 continue
             
             try:
-                logger.info(f"Publishing: {it['title'][:60]}...")
+                logger.info("Publishing: %s...", it['title'][:60])
                 
                 success = await publish_post_with_retry(
                     bot=bot,
@@ -128,17 +142,17 @@ async def post_cycle() -> int:
                     mark_posted(uid, it["title"], it["link"])
                     increment_today_posts()
                     posted_count += 1
-                    posts_today = get_today_posts_count()
-                    logger.info(f"✅ Published ({posted_count}/{limit_this_run})")
+                    posts_today += 1
+                    logger.info("✅ Published (%d/%d)", posted_count, limit_this_run)
                     await asyncio.sleep(2)
                 else:
-                    logger.warning(f"Failed to publish: {it['title'][:60]}")
+                    logger.warning("Failed to publish: %s", it['title'][:60])
                     
             except Exception as e:
-                logger.exception(f"Error publishing post: {e}")
+                logger.exception("Error publishing post: %s", e)
         
         if posted_count > 0:
-            logger.info(f"✅ Total published: {posted_count} (today: {get_today_posts_count()}/{MAX_POSTS_PER_DAY})")
+            logger.info("✅ Total published: %d (today: %d/%d)", posted_count, get_today_posts_count(), MAX_POSTS_PER_DAY)
             last_check_status = "OK"
         else:
             logger.info("No new posts")
@@ -147,7 +161,7 @@ async def post_cycle() -> int:
         return posted_count
         
     except Exception as e:
-        logger.exception(f"Critical error in post_cycle: {e}")
+        logger.exception("Critical error in post_cycle: %s", e)
         last_check_status = "ERROR"
         return 0
 
@@ -206,9 +220,9 @@ async def scheduler():
             cleanup_old_stats(days_to_keep=30)
             await post_cycle()
         except Exception as e:
-            logger.exception(f"Scheduler error: {e}")
+            logger.exception("Scheduler error: %s", e)
         
-        logger.info(f"Next check in {CHECK_INTERVAL_SECONDS // 60} minutes")
+        logger.info("Next check in %d minutes", CHECK_INTERVAL_SECONDS // 60)
         
         # Используем wait вместо sleep для быстрой реакции на shutdown
         try:
@@ -220,33 +234,53 @@ async def scheduler():
 # === GRACEFUL SHUTDOWN ===
 def signal_handler(signum, frame):
     """Обработчик сигналов для graceful shutdown"""
-    logger.info(f"Received signal {signum}, initiating shutdown...")
+    logger.info("Received signal %s, initiating shutdown...", signum)
     shutdown_event.set()
 
 async def shutdown():
     """Корректное завершение работы"""
     logger.info("Shutting down bot...")
-    
+
+    # Закрываем общую HTTP-сессию и клиент HF
+    if http_session:
+        await http_session.close()
+    await close_hf_client()
+
     # Закрываем соединение с Telegram
     await bot.session.close()
     
     # Останавливаем dispatcher
     await dp.stop_polling()
-    
+
     logger.info("Bot stopped")
 
+    # Дописываем очередь логов и останавливаем фоновый поток
+    if _log_listener:
+        _log_listener.stop()
+
 # === MAIN ===
 async def main():
+    global http_session
+
     # Установка обработчиков сигналов
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
-    
+
     logger.info("🚀 Starting bot...")
-    
+
     try:
         # Инициализация БД
         init_db()
         logger.info("✅ Database ready")
+
+        # Дефолтная картинка читается с диска один раз
+        load_default_image()
+
+        # Общая HTTP-сессия для RSS и картинок
+        http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=10),
+            timeout=aiohttp.ClientTimeout(total=10),
+        )
         
         # Запуск healthcheck сервера
         await start_healthcheck_server()
@@ -257,15 +291,15 @@ async def main():
         
         # Проверка подключения к Telegram
         me = await bot.get_me()
-        logger.info(f"✅ Bot connected: @{me.username}")
-        logger.info(f"✅ Channel: {CHANNEL_ID}")
+        logger.info("✅ Bot connected: @%s", me.username)
+        logger.info("✅ Channel: %s", CHANNEL_ID)
         
         # Запуск polling
         logger.info("✅ Starting polling...")
         await dp.start_polling(bot)
         
     except Exception as e:
-        logger.exception(f"Fatal error: {e}")
+        logger.exception("Fatal error: %s", e)
     finally:
         await shutdown()
 
@@ -275,5 +309,5 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         logger.info("Interrupted by user")
     except Exception as e:
-        logger.exception(f"Unhandled exception: {e}")
+        logger.exception("Unhandled exception: %s", e)
         sys.exit(1)
@@ -7,19 +7,40 @@ from contextlib import contextmanager
 
 DB_PATH = "news.db"
 _lock = threading.Lock()
+_conn: sqlite3.Connection | None = None
+_posted_uids: set[str] = set()  # все опубликованные uid в памяти — O(1) проверка без SQL
+_today_cache = {"date": None, "count": 0}  # счётчик за сегодня; меняет его только этот процесс
+
+def _get_conn() -> sqlite3.Connection:
+    """Одно долгоживущее соединение в WAL-режиме вместо connect/close на каждый запрос"""
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None, timeout=10.0)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.execute("PRAGMA temp_store=MEMORY")
+        _conn.execute("PRAGMA cache_size=-64000")
+    return _conn
 
 @contextmanager
-def db_connection():
-    """Thread-safe database connection"""
+def db_write():
+    """Короткая write-транзакция под глобальным lock.
+
+    Читатели ходят в соединение напрямую без lock — WAL-режим позволяет
+    читать параллельно с записью.
+    """
     with _lock:
-        conn = sqlite3.connect(DB_PATH, timeout=10.0)
+        conn = _get_conn()
+        conn.execute("BEGIN IMMEDIATE")
         try:
             yield conn
-        finally:
-            conn.close()
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
 
 def init_db():
-    with db_connection() as conn:
+    with db_write() as conn:
         cur = conn.cursor()
         cur.execute("""
             CREATE TABLE IF NOT EXISTS posted (
@@ -42,44 +63,69 @@ def init_db():
                 retry_after INTEGER NOT NULL
             )
         """)
-        conn.commit()
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS feed_cache (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                body BLOB,
+                fetched_at INTEGER NOT NULL
+            )
+        """)
+        # Индексы для выборок по времени: дешёвые на вставке при ~10 постах в день
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_posted_created ON posted(created_at)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_failed_retry ON failed_sources(retry_after)")
+
+        # Загружаем uid в память один раз — дальше is_posted без SQL
+        cur.execute("SELECT uid FROM posted")
+        _posted_uids.clear()
+        _posted_uids.update(row[0] for row in cur.fetchall())
 
 def is_posted(uid: str) -> bool:
-    with db_connection() as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT 1 FROM posted WHERE uid=? LIMIT 1", (uid,))
-        return cur.fetchone() is not None
+    return uid in _posted_uids
+
+def filter_unposted(uids: list[str]) -> set[str]:
+    """Вернуть uid из списка, которые уже опубликованы — одна проверка вместо 30"""
+    return _posted_uids.intersection(uids)
 
 def mark_posted(uid: str, title: str = "", link: str = ""):
-    with db_connection() as conn:
+    with db_write() as conn:
         cur = conn.cursor()
         cur.execute(
             "INSERT OR IGNORE INTO posted(uid, created_at, title, link) VALUES (?, ?, ?, ?)",
             (uid, int(time.time()), title[:300], link[:500]),
         )
-        conn.commit()
+    _posted_uids.add(uid)
 
 def get_today_posts_count() -> int:
     today = datetime.now().strftime("%Y-%m-%d")
-    with db_connection() as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT posts_count FROM daily_stats WHERE date=?", (today,))
-        row = cur.fetchone()
-        return row[0] if row else 0
+    if _today_cache["date"] == today:
+        return _today_cache["count"]
+    # Чтение без lock: WAL позволяет читать параллельно с записью
+    cur = _get_conn().execute("SELECT posts_count FROM daily_stats WHERE date=?", (today,))
+    row = cur.fetchone()
+    count = row[0] if row else 0
+    _today_cache["date"] = today
+    _today_cache["count"] = count
+    return count
 
 def increment_today_posts():
     today = datetime.now().strftime("%Y-%m-%d")
-    with db_connection() as conn:
+    with db_write() as conn:
         cur = conn.cursor()
         cur.execute("""
             INSERT INTO daily_stats (date, posts_count) VALUES (?, 1)
             ON CONFLICT(date) DO UPDATE SET posts_count = posts_count + 1
         """, (today,))
-        conn.commit()
+    if _today_cache["date"] == today:
+        _today_cache["count"] += 1
+    else:
+        _today_cache["date"] = today
+        _today_cache["count"] = 1
 
 def mark_source_failed(source_url: str, backoff_seconds: int):
     """Отметить источник как временно недоступный"""
-    with db_connection() as conn:
+    with db_write() as conn:
         cur = conn.cursor()
         now = int(time.time())
         retry_after = now + backoff_seconds
@@ -87,40 +133,52 @@ def mark_source_failed(source_url: str, backoff_seconds: int):
             INSERT OR REPLACE INTO failed_sources (source_url, failed_at, retry_after)
             VALUES (?, ?, ?)
         """, (source_url, now, retry_after))
-        conn.commit()
 
 def is_source_available(source_url: str) -> bool:
     """Проверить, можно ли использовать источник"""
-    with db_connection() as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT retry_after FROM failed_sources WHERE source_url=?", (source_url,))
-        row = cur.fetchone()
-        if not row:
-            return True
-        retry_after = row[0]
-        now = int(time.time())
-        return now >= retry_after
+    cur = _get_conn().execute("SELECT retry_after FROM failed_sources WHERE source_url=?", (source_url,))
+    row = cur.fetchone()
+    if not row:
+        return True
+    retry_after = row[0]
+    now = int(time.time())
+    return now >= retry_after
 
 def clear_available_sources():
     """Очистить источники, которые снова доступны"""
-    with db_connection() as conn:
+    with db_write() as conn:
         cur = conn.cursor()
         now = int(time.time())
         cur.execute("DELETE FROM failed_sources WHERE retry_after <= ?", (now,))
-        conn.commit()
+
+def get_feed_cache(url: str):
+    """Вернуть (etag, last_modified, body) для условного GET, или (None, None, None)"""
+    cur = _get_conn().execute("SELECT etag, last_modified, body FROM feed_cache WHERE url=?", (url,))
+    row = cur.fetchone()
+    return row if row else (None, None, None)
+
+def save_feed_cache(url: str, etag, last_modified, body: bytes):
+    with db_write() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT OR REPLACE INTO feed_cache (url, etag, last_modified, body, fetched_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, (url, etag, last_modified, body, int(time.time())))
 
 def cleanup_old_stats(days_to_keep: int = 7):
     cutoff = (datetime.now() - timedelta(days=days_to_keep)).strftime("%Y-%m-%d")
-    with db_connection() as conn:
+    with db_write() as conn:
         cur = conn.cursor()
         cur.execute("DELETE FROM daily_stats WHERE date < ?", (cutoff,))
-        conn.commit()
 
 def reset_db():
-    with db_connection() as conn:
+    with db_write() as conn:
         cur = conn.cursor()
         cur.execute("DROP TABLE IF EXISTS posted")
         cur.execute("DROP TABLE IF EXISTS daily_stats")
         cur.execute("DROP TABLE IF EXISTS failed_sources")
-        conn.commit()
+        cur.execute("DROP TABLE IF EXISTS feed_cache")
+    _posted_uids.clear()
+    _today_cache["date"] = None
+    _today_cache["count"] = 0
     init_db()
@@ -1,49 +1,79 @@
 # publisher.py
+import asyncio
 import re
 import random
-import time
 import logging
 from typing import Optional
-import requests
+import ahocorasick
+import blake3
+import httpx
 from aiogram import Bot
-from aiogram.types import FSInputFile, URLInputFile
+from aiogram.types import BufferedInputFile, FSInputFile, URLInputFile
 from aiogram.exceptions import TelegramRetryAfter, TelegramBadRequest, TelegramServerError
 from config import (
-    DEFAULT_IMAGE_PATH, CAPTION_LIMIT, HF_TOKEN, HF_REWRITE_MODEL, 
+    DEFAULT_IMAGE_PATH, CAPTION_LIMIT, HF_TOKEN, HF_REWRITE_MODEL,
     REWRITE_MAX_CHARS, TELEGRAM_RETRY_ATTEMPTS, TELEGRAM_RETRY_DELAY
 )
+from text_utils import strip_html
 
 UA = {"User-Agent": "Mozilla/5.0 CryptoAI_Bot/1.0"}
 logger = logging.getLogger(__name__)
 
-def strip_html(text: str) -> str:
-    if not text:
-        return ""
-    text = re.sub(r"<br\s*/?>", "\n", text, flags=re.I)
-    text = re.sub(r"<.*?>", "", text)
-    return " ".join(text.split()).strip()
+# Общий асинхронный клиент для HF — держит пул соединений между вызовами
+_hf_client = httpx.AsyncClient(timeout=40)
+
+async def close_hf_client():
+    """Закрыть пул соединений HF-клиента при остановке бота"""
+    await _hf_client.aclose()
+
+_hf_cache: dict[str, str] = {}  # hash(src) → готовый RU-текст; retry того же поста не ходит в HF
+_HF_CACHE_MAX = 256
+
+_default_image_bytes: bytes | None = None
+
+def load_default_image():
+    """Прочитать дефолтную картинку один раз при старте — не перечитываем с диска на каждый пост"""
+    global _default_image_bytes
+    with open(DEFAULT_IMAGE_PATH, "rb") as f:
+        _default_image_bytes = f.read()
+
+# Регулярки компилируем один раз при импорте — не пересобираем на каждый пост
+_URL_PATTERNS = [r"https?://\S+", r"www\.\S+"]
+_RE_URL = re.compile("|".join(_URL_PATTERNS))
+_RE_CYRILLIC = re.compile(r"[А-Яа-яЁё]")
+_SOURCE_REF_PATTERNS = [
+    r"по данным\s+\S+", r"источник[:\s]+\S+", r"сообщает\s+\S+",
+    r"пишет\s+\S+", r"согласно\s+\S+", r"как сообщает\s+\S+",
+    r"reported by\s+\S+", r"according to\s+\S+", r"source[:\s]+\S+",
+]
+# Одна альтернация вместо девяти проходов по строке
+_RE_SRC = re.compile("|".join(_SOURCE_REF_PATTERNS), re.I)
+# Слитая очистка: URL + ссылки на источники (+ латиница для русских текстов) за один проход
+_RE_CLEAN = re.compile("|".join(_URL_PATTERNS + _SOURCE_REF_PATTERNS), re.I)
+_RE_CLEAN_LATIN = re.compile("|".join(_URL_PATTERNS + _SOURCE_REF_PATTERNS + [r"[a-zA-Z]{3,}"]), re.I)
 
 def remove_urls(text: str) -> str:
     if not text:
         return ""
-    text = re.sub(r"https?://\S+", "", text)
-    text = re.sub(r"www\.\S+", "", text)
+    text = _RE_URL.sub("", text)
     return " ".join(text.split()).strip()
 
 def remove_source_refs(text: str) -> str:
     if not text:
         return ""
-    patterns = [
-        r"по данным\s+\S+", r"источник[:\s]+\S+", r"сообщает\s+\S+",
-        r"пишет\s+\S+", r"согласно\s+\S+", r"как сообщает\s+\S+",
-        r"reported by\s+\S+", r"according to\s+\S+", r"source[:\s]+\S+",
-    ]
-    for pattern in patterns:
-        text = re.sub(pattern, "", text, flags=re.I)
+    text = _RE_SRC.sub("", text)
     return " ".join(text.split()).strip()
 
 def looks_ru(text: str) -> bool:
-    return bool(re.search(r"[А-Яа-яЁё]", text or ""))
+    return bool(_RE_CYRILLIC.search(text or ""))
+
+def clean_text_ru(text: str) -> str:
+    """Убрать URL, ссылки на источники и (для русского текста) латиницу одним re.sub"""
+    if not text:
+        return ""
+    text = strip_html(text)
+    pattern = _RE_CLEAN_LATIN if looks_ru(text) else _RE_CLEAN
+    return " ".join(pattern.sub("", text).split()).strip()
 
 def truncate(text: str, limit: int) -> str:
     if len(text) <= limit:
@@ -51,18 +81,8 @@ def truncate(text: str, limit: int) -> str:
     return text[: max(0, limit - 1)] + "…"
 
 def simple_rewrite_ru(title: str, summary: str) -> str:
-    title = strip_html(title)
-    summary = strip_html(summary)
-    title = remove_urls(title)
-    summary = remove_urls(summary)
-    title = remove_source_refs(title)
-    summary = remove_source_refs(summary)
-    if looks_ru(title):
-        title = re.sub(r'[a-zA-Z]{3,}', '', title)
-    if looks_ru(summary):
-        summary = re.sub(r'[a-zA-Z]{3,}', '', summary)
-    title = " ".join(title.split()).strip()
-    summary = " ".join(summary.split()).strip()
+    title = clean_text_ru(title)
+    summary = clean_text_ru(summary)
     if not title:
         title = "Новость"
     emojis = ["🔥", "💎", "⚡", "🚀", "📊", "💰", "🎯", "⭐"]
@@ -77,21 +97,41 @@ def simple_rewrite_ru(title: str, summary: str) -> str:
         main_text += f"\n\n💡 {market_impact}"
     return main_text
 
+# Категории в порядке приоритета — как в прежней цепочке if/any
+_IMPACT_RULES = [
+    (["рост", "повышение", "подъем", "rally", "bullish", "прибыль"],
+     "Позитивный сигнал для рынка — возможен рост котировок."),
+    (["падение", "снижение", "обвал", "crash", "bearish", "убыток"],
+     "Негативный фактор — возможна коррекция цен."),
+    (["регулир", "запрет", "ограничение", "санкции", "закон"],
+     "Регуляторные изменения могут повлиять на волатильность."),
+    (["обновление", "запуск", "интеграция", "технология", "upgrade"],
+     "Технологическое развитие — укрепление позиций в долгосрочной перспективе."),
+    (["инвестиции", "фонд", "институц", "биржа", "listing"],
+     "Институциональный интерес — сигнал роста доверия к активу."),
+]
+_IMPACT_DEFAULT = "Рынок наблюдает за развитием событий — возможна повышенная волатильность."
+
+# Автомат Ахо-Корасик: один проход по тексту вместо ~30 поисков подстрок
+_impact_automaton = ahocorasick.Automaton()
+for _prio, (_words, _msg) in enumerate(_IMPACT_RULES):
+    for _word in _words:
+        _impact_automaton.add_word(_word, _prio)
+_impact_automaton.make_automaton()
+
 def generate_market_impact(title: str, summary: str) -> str:
     text = (title + " " + summary).lower()
-    if any(word in text for word in ["рост", "повышение", "подъем", "rally", "bullish", "прибыль"]):
-        return "Позитивный сигнал для рынка — возможен рост котировок."
-    if any(word in text for word in ["падение", "снижение", "обвал", "crash", "bearish", "убыток"]):
-        return "Негативный фактор — возможна коррекция цен."
-    if any(word in text for word in ["регулир", "запрет", "ограничение", "санкции", "закон"]):
-        return "Регуляторные изменения могут повлиять на волатильность."
-    if any(word in text for word in ["обновление", "запуск", "интеграция", "технология", "upgrade"]):
-        return "Технологическое развитие — укрепление позиций в долгосрочной перспективе."
-    if any(word in text for word in ["инвестиции", "фонд", "институц", "биржа", "listing"]):
-        return "Институциональный интерес — сигнал роста доверия к активу."
-    return "Рынок наблюдает за развитием событий — возможна повышенная волатильность."
-
-def hf_rewrite_to_ru(title: str, summary: str) -> Optional[str]:
+    best = None
+    for _, prio in _impact_automaton.iter(text):
+        if best is None or prio < best:
+            best = prio
+            if best == 0:
+                break
+    if best is None:
+        return _IMPACT_DEFAULT
+    return _IMPACT_RULES[best][1]
+
+async def hf_rewrite_to_ru(title: str, summary: str) -> Optional[str]:
     if not HF_TOKEN:
         return None
     title = remove_urls(strip_html(title))
@@ -103,6 +143,9 @@ def hf_rewrite_to_ru(title: str, summary: str) -> Optional[str]:
     if not src:
         return None
     src = src[:1400]
+    cache_key = blake3.blake3(src.encode("utf-8")).hexdigest(length=16)
+    if cache_key in _hf_cache:
+        return _hf_cache[cache_key]
     prompt = (
         "Сделай уникальный пересказ на русском языке для Telegram-поста.\n"
         "Правила:\n"
@@ -117,7 +160,7 @@ def hf_rewrite_to_ru(title: str, summary: str) -> Optional[str]:
         api_url = f"https://api-inference.huggingface.co/models/{HF_REWRITE_MODEL}"
         headers = {"Authorization": f"Bearer {HF_TOKEN}"}
         payload = {"inputs": prompt, "parameters": {"max_new_tokens": 300, "temperature": 0.7}}
-        r = requests.post(api_url, headers=headers, json=payload, timeout=40)
+        r = await _hf_client.post(api_url, headers=headers, json=payload)
         if r.status_code != 200:
             return None
         data = r.json()
@@ -133,9 +176,13 @@ def hf_rewrite_to_ru(title: str, summary: str) -> Optional[str]:
         out = re.sub(r"(?is).*?Текст:\s*", "", out).strip()
         if not out or not looks_ru(out):
             return None
-        return truncate(out, REWRITE_MAX_CHARS)
+        result = truncate(out, REWRITE_MAX_CHARS)
+        if len(_hf_cache) >= _HF_CACHE_MAX:
+            _hf_cache.clear()
+        _hf_cache[cache_key] = result
+        return result
     except Exception as e:
-        logger.warning(f"HF rewrite failed: {e}")
+        logger.warning("HF rewrite failed: %s", e)
         return None
 
 async def publish_post_with_retry(
@@ -149,7 +196,8 @@ async def publish_post_with_retry(
     Публикация с retry механизмом.
     Возвращает True если успешно, False если провалилось.
     """
-    ru_text = hf_rewrite_to_ru(title, summary)
+    # Без токена HF не вызываем вовсе — сразу локальный рерайт
+    ru_text = await hf_rewrite_to_ru(title, summary) if HF_TOKEN else None
     if not ru_text:
         ru_text = simple_rewrite_ru(title, summary)
     
@@ -162,38 +210,40 @@ async def publish_post_with_retry(
     
     if image_url:
         photo = URLInputFile(image_url, headers=UA)
+    elif _default_image_bytes:
+        photo = BufferedInputFile(_default_image_bytes, filename="default.jpg")
     else:
         photo = FSInputFile(DEFAULT_IMAGE_PATH)
     
     for attempt in range(TELEGRAM_RETRY_ATTEMPTS):
         try:
             await bot.send_photo(chat_id=channel_id, photo=photo, caption=caption)
-            logger.info(f"Successfully published post (attempt {attempt + 1})")
+            logger.info("Successfully published post (attempt %d)", attempt + 1)
             return True
             
         except TelegramRetryAfter as e:
             # Telegram просит подождать
             wait_time = e.retry_after + 5
-            logger.warning(f"Rate limit hit, waiting {wait_time}s")
-            time.sleep(wait_time)
+            logger.warning("Rate limit hit, waiting %ds", wait_time)
+            await asyncio.sleep(wait_time)
             
         except TelegramBadRequest as e:
             # Битый запрос (плохая картинка, etc) → не retry
-            logger.error(f"Bad request, skipping: {e}")
+            logger.error("Bad request, skipping: %s", e)
             return False
             
         except TelegramServerError as e:
             # 502, 503 → retry
-            logger.warning(f"Telegram server error (attempt {attempt + 1}): {e}")
+            logger.warning("Telegram server error (attempt %d): %s", attempt + 1, e)
             if attempt < TELEGRAM_RETRY_ATTEMPTS - 1:
-                time.sleep(TELEGRAM_RETRY_DELAY)
+                await asyncio.sleep(TELEGRAM_RETRY_DELAY)
             
         except Exception as e:
-            logger.exception(f"Unexpected error publishing post (attempt {attempt + 1}): {e}")
+            logger.exception("Unexpected error publishing post (attempt %d): %s", attempt + 1, e)
             if attempt < TELEGRAM_RETRY_ATTEMPTS - 1:
-                time.sleep(TELEGRAM_RETRY_DELAY)
+                await asyncio.sleep(TELEGRAM_RETRY_DELAY)
     
-    logger.error(f"Failed to publish post after {TELEGRAM_RETRY_ATTEMPTS} attempts")
+    logger.error("Failed to publish post after %d attempts", TELEGRAM_RETRY_ATTEMPTS)
     return False
 
 async def publish_post(bot: Bot, channel_id: str, title: str, summary: str, image_url: Optional[str]):
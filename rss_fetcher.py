@@ -1,13 +1,18 @@
 # rss_fetcher.py
+import asyncio
 import hashlib
-import re
 import logging
 from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+import aiohttp
+import blake3
 import feedparser
-import requests
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
 from config import RSS_RETRY_ATTEMPTS, RSS_BACKOFF_TIME, MIN_TITLE_LENGTH, MIN_SUMMARY_LENGTH
-from db import mark_source_failed, is_source_available, clear_available_sources
+from db import (
+    mark_source_failed, is_source_available, clear_available_sources, is_posted,
+    get_feed_cache, save_feed_cache,
+)
+from text_utils import strip_html
 
 UA = {"User-Agent": "Mozilla/5.0 CryptoAI_Bot/1.0"}
 logger = logging.getLogger(__name__)
@@ -23,16 +28,15 @@ def clean_url(url: str) -> str:
     except Exception:
         return url
 
-def strip_html(text: str) -> str:
-    if not text:
-        return ""
-    text = re.sub(r"<br\s*/?>", "\n", text, flags=re.I)
-    text = re.sub(r"<.*?>", "", text)
-    return " ".join(text.split()).strip()
-
 def make_uid(source: str, link: str, title: str) -> str:
     base = f"{source}|{clean_url(link)}|{title}".strip()
-    return hashlib.sha256(base.encode("utf-8")).hexdigest()
+    # Переходный период: в posted лежат старые sha256-uid, и по новому blake3-uid
+    # они бы не находились — новость ушла бы в канал повторно. Если sha256-uid
+    # уже опубликован, возвращаем его; убрать, когда sha256-записи выйдут из окон фидов
+    legacy_uid = hashlib.sha256(base.encode("utf-8")).hexdigest()
+    if is_posted(legacy_uid):
+        return legacy_uid
+    return blake3.blake3(base.encode("utf-8")).hexdigest(length=32)
 
 def is_valid_item(title: str, summary: str) -> bool:
     """Проверка что новость не пустая"""
@@ -58,93 +62,143 @@ def try_get_image_from_entry(entry) -> str:
                 return href
     return ""
 
-def try_get_og_image(link: str) -> str:
+_og_image_cache: dict[str, str] = {}  # link → og:image, чтобы не качать одну страницу каждый цикл
+_OG_CACHE_MAX = 2048
+
+async def try_get_og_image(session: aiohttp.ClientSession, link: str) -> str:
     if not link:
         return ""
+    if link in _og_image_cache:
+        return _og_image_cache[link]
     try:
-        r = requests.get(link, headers=UA, timeout=10)
-        if r.status_code != 200:
-            return ""
-        soup = BeautifulSoup(r.text, "html.parser")
-        tag = soup.find("meta", property="og:image")
-        if tag and tag.get("content"):
-            return tag["content"].strip()
-        tag = soup.find("meta", attrs={"name": "twitter:image"})
-        if tag and tag.get("content"):
-            return tag["content"].strip()
-        return ""
+        timeout = aiohttp.ClientTimeout(total=5)
+        async with session.get(link, headers=UA, timeout=timeout) as r:
+            if r.status != 200:
+                return ""
+            # og:image всегда в <head> — хватает первых 32KB вместо всей страницы
+            chunk = await r.content.read(32768)
+        tree = LexborHTMLParser(chunk.decode("utf-8", errors="ignore"))
+        image = ""
+        for selector in ('meta[property="og:image"]', 'meta[name="twitter:image"]'):
+            tag = tree.css_first(selector)
+            if tag:
+                content = tag.attributes.get("content")
+                if content:
+                    image = content.strip()
+                    break
+        # Кэшируем и пустой результат: страница без og:image не изменится к следующему циклу
+        if len(_og_image_cache) >= _OG_CACHE_MAX:
+            _og_image_cache.clear()
+        _og_image_cache[link] = image
+        return image
     except Exception as e:
-        logger.warning(f"Failed to get og:image from {link}: {e}")
+        logger.warning("Failed to get og:image from %s: %s", link, e)
         return ""
 
-def fetch_single_feed(feed_url: str, limit_total: int) -> list[dict]:
+async def fetch_single_feed(session: aiohttp.ClientSession, feed_url: str, limit_total: int) -> list[dict]:
     """Получить новости из одного RSS с retry"""
-    items = []
-    
     # Проверяем не "забанен" ли источник
     if not is_source_available(feed_url):
-        logger.info(f"Source {feed_url} is temporarily unavailable, skipping")
+        logger.info("Source %s is temporarily unavailable, skipping", feed_url)
         return []
-    
+
+    # Условный GET: если фид не менялся, сервер ответит 304 с пустым телом
+    etag, last_modified, cached_body = get_feed_cache(feed_url)
+    headers = dict(UA)
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
     for attempt in range(RSS_RETRY_ATTEMPTS):
+        items = []
         try:
-            logger.debug(f"Fetching {feed_url} (attempt {attempt + 1}/{RSS_RETRY_ATTEMPTS})")
-            d = feedparser.parse(feed_url)
-            
+            logger.debug("Fetching %s (attempt %d/%d)", feed_url, attempt + 1, RSS_RETRY_ATTEMPTS)
+            async with session.get(feed_url, headers=headers) as resp:
+                if resp.status == 304 and cached_body:
+                    logger.debug("Feed %s not modified, using cached body", feed_url)
+                    content = cached_body
+                elif resp.status != 200:
+                    raise Exception(f"HTTP {resp.status}")
+                else:
+                    content = await resp.read()
+                    save_feed_cache(
+                        feed_url,
+                        resp.headers.get("ETag"),
+                        resp.headers.get("Last-Modified"),
+                        content,
+                    )
+
+            # Парсинг CPU-bound → уводим с event loop
+            d = await asyncio.to_thread(feedparser.parse, content)
+
             if d.bozo:  # feedparser нашел ошибку
                 raise Exception(f"Feed parsing error: {d.bozo_exception}")
-            
+
             source = (d.feed.get("title") or feed_url).strip()
-            
+
+            need_og_image = []
             for entry in d.entries[:limit_total]:
                 title = strip_html(entry.get("title", "")).strip()
                 summary = strip_html(entry.get("summary", "") or entry.get("description", "")).strip()
                 link = clean_url(entry.get("link", "")).strip()
-                
+
                 if not is_valid_item(title, summary):
-                    logger.debug(f"Skipping invalid item: {title[:50]}")
+                    logger.debug("Skipping invalid item: %s", title[:50])
                     continue
-                
-                image_url = try_get_image_from_entry(entry)
-                if not image_url:
-                    image_url = try_get_og_image(link)
-                
+
                 uid = make_uid(source, link, title)
-                
-                items.append({
+
+                item = {
                     "uid": uid,
                     "title": title,
                     "summary": summary,
                     "link": link,
                     "source": source,
-                    "image_url": image_url,
-                })
-            
-            logger.info(f"Successfully fetched {len(items)} items from {feed_url}")
+                    "image_url": try_get_image_from_entry(entry),
+                }
+                items.append(item)
+                # Для уже опубликованных материалов og:image не нужен — не тратим HTTP-запрос
+                if not item["image_url"] and not is_posted(uid):
+                    need_og_image.append(item)
+
+            # og:image качаем параллельно, но не больше 5 соединений на источник
+            if need_og_image:
+                sem = asyncio.Semaphore(5)
+
+                async def fill_og_image(item: dict):
+                    async with sem:
+                        item["image_url"] = await try_get_og_image(session, item["link"])
+
+                await asyncio.gather(*(fill_og_image(it) for it in need_og_image))
+
+            logger.info("Successfully fetched %d items from %s", len(items), feed_url)
             return items
-            
+
         except Exception as e:
-            logger.warning(f"Failed to fetch {feed_url} (attempt {attempt + 1}): {e}")
+            logger.warning("Failed to fetch %s (attempt %d): %s", feed_url, attempt + 1, e)
             if attempt == RSS_RETRY_ATTEMPTS - 1:
                 # Последняя попытка провалилась → "банить" источник
-                logger.error(f"All attempts failed for {feed_url}, marking as unavailable for {RSS_BACKOFF_TIME}s")
+                logger.error("All attempts failed for %s, marking as unavailable for %ds", feed_url, RSS_BACKOFF_TIME)
                 mark_source_failed(feed_url, RSS_BACKOFF_TIME)
-    
+
     return []
 
-def fetch_items(feed_urls: list[str], limit_total: int = 20) -> list[dict]:
-    """Получить новости из всех RSS"""
+async def fetch_items(session: aiohttp.ClientSession, feed_urls: list[str], limit_total: int = 20) -> list[dict]:
+    """Получить новости из всех RSS параллельно"""
     clear_available_sources()  # Разбанить источники, у которых прошло время
-    
-    all_items = []
-    for url in feed_urls:
-        items = fetch_single_feed(url, limit_total)
-        all_items.extend(items)
-    
-    # Убираем дубли
-    uniq = {}
-    for it in all_items:
-        uniq[it["uid"]] = it
-    
-    logger.info(f"Total unique items: {len(uniq)}")
-    return list(uniq.values())
+
+    results = await asyncio.gather(*(fetch_single_feed(session, url, limit_total) for url in feed_urls))
+
+    # Убираем дубли одним проходом, без промежуточного списка и dict
+    seen: set[str] = set()
+    out: list[dict] = []
+    for items in results:
+        for it in items:
+            if it["uid"] in seen:
+                continue
+            seen.add(it["uid"])
+            out.append(it)
+
+    logger.info("Total unique items: %d", len(out))
+    return out
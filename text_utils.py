@@ -0,0 +1,8 @@
+# text_utils.py
+from selectolax.lexbor import LexborHTMLParser
+
+def strip_html(text: str) -> str:
+    """Убрать HTML-теги и схлопнуть пробелы (C-парсер Lexbor вместо регулярок)"""
+    if not text:
+        return ""
+    return " ".join(LexborHTMLParser(text).text(separator=" ").split()).strip()